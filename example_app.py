@@ -19,7 +19,7 @@ def on_quote(quote, backlog):
         global bid_count
         global backlog_count
         backlog_count = backlog
-        if isinstance(quote, Quote) and 'type' in quote.__dict__:
+        if isinstance(quote, Quote) and hasattr(quote, 'type'):
             if quote.type == "ask": ask_count += 1
             else: bid_count += 1
 
@@ -3,13 +3,15 @@ import requests
 import threading
 import websocket
 import logging
-import queue
+import os
+import collections
 import struct
 import sys
 import wsaccel
 from typing import Optional, Dict, Any
 
 SELF_HEAL_BACKOFFS = [10, 30, 60, 300, 600]
+SELF_HEAL_RESET_SECONDS = 120  # start back at the shortest backoff if the connection stayed up at least this long
 REALTIME = "REALTIME"
 DELAYED_SIP = "DELAYED_SIP"
 NASDAQ_BASIC = "NASDAQ_BASIC"
@@ -23,15 +25,35 @@ OTC = "OTC"
 NASDAQ_BASIC = "NASDAQ_BASIC"
 IEX = "IEX"
 SUB_PROVIDERS = [NO_SUBPROVIDER, CTA_A, CTA_B, UTP, OTC, NASDAQ_BASIC, IEX]
+SUBPROVIDER_BY_CODE = tuple(SUB_PROVIDERS + [IEX] * (256 - len(SUB_PROVIDERS)))  # indexed by the subprovider byte; unknown codes default to IEX for backward behavior consistency.
+# Fixed-width fields that follow the symbol: subprovider, market center, price, size, timestamp, [total volume,] condition length.
+QUOTE_LAYOUT = struct.Struct('<BHfLQB')  # the market center is a single little-endian UTF-16 code unit
+TRADE_LAYOUT = struct.Struct('<BHfLQLB')
+DARKPOOL_MARKET_CENTERS = frozenset(['D', 'E', '\0'])
 MAX_QUEUE_SIZE = 250000
-DEBUGGING = not (sys.gettrace() is None)
+HANDLER_BATCH_SIZE = 1024  # most frames QuoteHandler takes per backlog reading
+ASCII_CACHE_LIMIT = 16384
+FIREHOSE_CHANNEL_BYTES = b"$FIREHOSE"
 HEADER_MESSAGE_FORMAT_KEY = "UseNewEquitiesFormat"
 HEADER_MESSAGE_FORMAT_VALUE = "v2"
 HEADER_CLIENT_INFORMATION_KEY = "Client-Information"
 HEADER_CLIENT_INFORMATION_VALUE = "IntrinioPythonSDKv5.3.3"
 
 
+# Symbols and conditions repeat constantly, so each distinct byte string is decoded (and interned) only once.
+ascii_cache = {}
+
+
+def decode_ascii_cached(raw: bytes) -> str:
+    value = sys.intern(raw.decode("ascii"))
+    if len(ascii_cache) < ASCII_CACHE_LIMIT:
+        ascii_cache[raw] = value
+    return value
+
+
 class Quote:
+    __slots__ = ("symbol", "type", "price", "size", "timestamp", "subprovider", "market_center", "condition")
+
     def __init__(self, symbol, type, price, size, timestamp, subprovider, market_center, condition):
         self.symbol = symbol
         self.type = type
@@ -46,20 +68,19 @@ class Quote:
     def json_keys():
         return ["symbol","type","price","size","timestamp","subprovider","market_center","condition"]
 
-    @classmethod
     def to_json_array(self):
         return f'["{self.symbol}","{self.type}",{self.price},{self.size},{self.timestamp},"{self.subprovider}","{self.market_center}","{self.condition}"]'
 
-    @classmethod
     def to_json(self):
         return f'{{"symbol":"{self.symbol}","type":"{self.type}","price":{self.price},"size":{self.size},"timestamp":{self.timestamp},"subprovider":"{self.subprovider}","market_center":"{self.market_center}","condition":"{self.condition}"}}'
 
-    @classmethod
     def __str__(self):
         return self.symbol + ", " + self.type + ", price: " + str(self.price) + ", size: " + str(self.size) + ", timestamp: " + str(self.timestamp) + ", subprovider: " + str(self.subprovider) + ", market_center: " + str(self.market_center) + ", condition: " + str(self.condition)
 
 
 class Trade:
+    __slots__ = ("symbol", "price", "size", "total_volume", "timestamp", "subprovider", "market_center", "condition")
+
     def __init__(self, symbol, price, size, total_volume, timestamp, subprovider, market_center, condition):
         self.symbol = symbol
         self.price = price
@@ -83,11 +104,11 @@ class Trade:
         return self.symbol + ", trade, price: " + str(self.price) + ", size: " + str(self.size) + ", timestamp: " + str(self.timestamp) + ", subprovider: " + str(self.subprovider) + ", market_center: " + str(self.market_center) + ", condition: " + str(self.condition)
 
     def is_darkpool(self):
-        return (not self.market_center) or self.market_center == 'D' or self.market_center == 'E' or self.market_center == '\0' or self.market_center.strip() == ''
+        return (not self.market_center) or self.market_center in DARKPOOL_MARKET_CENTERS or self.market_center.strip() == ''
 
 
 class IntrinioRealtimeClient:
-    def __init__(self, options: Dict[str, Any], on_trade: Optional[callable], on_quote: Optional[callable]):
+    def __init__(self, options: Dict[str, Any], on_trade: Optional[callable], on_quote: Optional[callable], on_trades: Optional[callable] = None, on_quotes: Optional[callable] = None):
         if options is None:
             raise ValueError("Options parameter is required")
 
@@ -98,7 +119,11 @@ class IntrinioRealtimeClient:
         self.provider = options.get('provider')
         self.ipaddress = options.get('ipaddress')
         self.tradesonly = options.get('tradesonly')
+        self.channel_mask = 1 if self.tradesonly else 0
+        self.join_prefix = bytes([74, self.channel_mask])
+        self.leave_prefix = bytes([76])
         self.bypass_parsing = options.get('bypass_parsing', False)
+        self.parser_cpu = options.get('parser_cpu')
 
         if 'channels' in options:
             self.channels = set(options['channels'])
@@ -118,10 +143,10 @@ class IntrinioRealtimeClient:
                 self.logger.setLevel(logging.INFO)
             self.logger.addHandler(log_handler)
 
-        if 'max_queue_size' in options:
-            self.quotes = queue.Queue(maxsize=options['max_queue_size'])
-        else:
-            self.quotes = queue.Queue(maxsize=MAX_QUEUE_SIZE)
+        # Single producer (the websocket thread), single consumer (QuoteHandler): a deque plus an event replaces queue.Queue's locking.
+        self.max_queue_size = options.get('max_queue_size', MAX_QUEUE_SIZE)
+        self.quotes = collections.deque()
+        self.quotes_ready = threading.Event()
 
         if self.api_key:
             if not self.valid_api_key(self.api_key):
@@ -136,13 +161,16 @@ class IntrinioRealtimeClient:
             if not self.password:
                 raise ValueError("Parameter 'password' must be specified")
 
-        if not callable(on_quote):
+        self.on_quotes = on_quotes if callable(on_quotes) else None
+        self.on_trades = on_trades if callable(on_trades) else None
+
+        if not callable(on_quote) and self.on_quotes is None:
             self.on_quote = None
             raise ValueError("Parameter 'on_quote' must be a function")
         else:
             self.on_quote = on_quote
 
-        if not callable(on_trade):
+        if not callable(on_trade) and self.on_trades is None:
             self.on_trade = None
             raise ValueError("Parameter 'on_trade' must be a function")
         else:
@@ -151,6 +179,9 @@ class IntrinioRealtimeClient:
         if self.provider not in PROVIDERS:
             raise ValueError(f"Parameter 'provider' is invalid, use one of {PROVIDERS}")
 
+        if (self.parser_cpu is not None) and ((type(self.parser_cpu) is not int) or self.parser_cpu < 0):
+            raise ValueError(f"Parameter 'parser_cpu' is invalid, use a non-negative int CPU index.")
+
         self.ready = False
         self.token = None
         self.ws = None
@@ -159,6 +190,7 @@ class IntrinioRealtimeClient:
         self.joined_channels = set()
         self.last_queue_warning_time = 0
         self.last_self_heal_backoff = -1
+        self.last_self_heal_time = 0
         self.quote_handler.start()
 
     def auth_url(self) -> str:
@@ -197,10 +229,13 @@ class IntrinioRealtimeClient:
             return "ws://" + self.ipaddress + "/socket/websocket?vsn=1.0.0&token=" + self.token
 
     def do_backoff(self):
+        if time.monotonic() - self.last_self_heal_time > SELF_HEAL_RESET_SECONDS:
+            self.last_self_heal_backoff = -1
         self.last_self_heal_backoff += 1
         i = min(self.last_self_heal_backoff, len(SELF_HEAL_BACKOFFS) - 1)
         backoff = SELF_HEAL_BACKOFFS[i]
         time.sleep(backoff)
+        self.last_self_heal_time = time.monotonic()
 
     def connect(self):
         connected = False
@@ -251,24 +286,31 @@ class IntrinioRealtimeClient:
         self.last_self_heal_backoff = -1
         self.refresh_channels()
 
+    def get_queue_size(self) -> int:
+        return len(self.quotes)
+
     def on_queue_full(self):
-        if time.time() - self.last_queue_warning_time > 1:
+        if time.monotonic() - self.last_queue_warning_time > 1:
             self.logger.error("Quote queue is full! Dropped some new quotes")
-            self.last_queue_warning_time = time.time()
+            self.last_queue_warning_time = time.monotonic()
 
     def join(self, channels: list[str]):
         if isinstance(channels, str):
             channels = [channels]
 
-        self.channels = self.channels | set(channels)
-        self.refresh_channels()
+        new_channels = set(channels) - self.channels
+        self.channels |= new_channels
+        if self.ready == True:
+            self.join_channels(new_channels - self.joined_channels)
 
     def leave(self, channels: list[str]):
         if isinstance(channels, str):
             channels = [channels]
 
-        self.channels = self.channels - set(channels)
-        self.refresh_channels()
+        old_channels = self.channels.intersection(channels)
+        self.channels -= old_channels
+        if self.ready == True:
+            self.leave_channels(old_channels & self.joined_channels)
 
     def leave_all(self):
         self.channels = set()
@@ -278,48 +320,43 @@ class IntrinioRealtimeClient:
         if self.ready != True:
             return
 
-        # Join new channels
-        new_channels = self.channels - self.joined_channels
-        self.logger.debug(f"New channels: {new_channels}")
+        self.join_channels(self.channels - self.joined_channels)
+        self.leave_channels(self.joined_channels - self.channels)
+        self.logger.debug("Current channels: %s", self.joined_channels)
+
+    def join_channels(self, new_channels):
+        if not new_channels:
+            return
+
+        self.logger.debug("New channels: %s", new_channels)
         for channel in new_channels:
             msg = self.join_binary_message(channel)
             self.ws.send(msg, websocket.ABNF.OPCODE_BINARY)
-            self.logger.info(f"Joined channel {channel}")
+            self.joined_channels.add(channel)
+        self.logger.info(f"Joined {len(new_channels)} channel(s)")
 
-        # Leave old channels
-        old_channels = self.joined_channels - self.channels
-        self.logger.debug(f"Old channels: {old_channels}")
+    def leave_channels(self, old_channels):
+        if not old_channels:
+            return
+
+        self.logger.debug("Old channels: %s", old_channels)
         for channel in old_channels:
             msg = self.leave_binary_message(channel)
             self.ws.send(msg, websocket.ABNF.OPCODE_BINARY)
-            self.logger.info(f"Left channel {channel}")
-
-        self.joined_channels = self.channels.copy()
-        self.logger.debug(f"Current channels: {self.joined_channels}")
+            self.joined_channels.discard(channel)
+        self.logger.info(f"Left {len(old_channels)} channel(s)")
 
     def join_binary_message(self, channel: str):
         if channel == "lobby":
-            message = bytearray([74, 1 if self.tradesonly else 0])
-            channel_bytes = bytes("$FIREHOSE", 'ascii')
-            message.extend(channel_bytes)
-            return message
+            return self.join_prefix + FIREHOSE_CHANNEL_BYTES
         else:
-            message = bytearray([74, 1 if self.tradesonly else 0])
-            channel_bytes = bytes(channel, 'ascii')
-            message.extend(channel_bytes)
-            return message
+            return self.join_prefix + bytes(channel, 'ascii')
 
     def leave_binary_message(self, channel: str):
         if channel == "lobby":
-            message = bytearray([76])
-            channel_bytes = bytes("$FIREHOSE", 'ascii')
-            message.extend(channel_bytes)
-            return message
+            return self.leave_prefix + FIREHOSE_CHANNEL_BYTES
         else:
-            message = bytearray([76])
-            channel_bytes = bytes(channel, 'ascii')
-            message.extend(channel_bytes)
-            return message
+            return self.leave_prefix + bytes(channel, 'ascii')
 
     def valid_api_key(self, api_key: str):
         if not isinstance(api_key, str):
@@ -369,15 +406,19 @@ class QuoteReceiver(threading.Thread):
 
     def on_message(self, ws, message):
         try:
-            if DEBUGGING:  # This is here for performance reasons so we don't use slow reflection on every message.
+            if self.client.logger.isEnabledFor(logging.DEBUG):  # Only pay for the hex dump when it will be logged.
                 if isinstance(message, str):
-                    self.client.logger.debug(f"Received message (hex): {message.encode('utf-8').hex()}")
+                    self.client.logger.debug("Received message (hex): %s", message.encode('utf-8').hex())
                 else:
                     if isinstance(message, bytes):
-                        self.client.logger.debug(f"Received message (hex): {message.hex()}")
-            self.client.quotes.put_nowait(message)
-        except queue.Full:
-            self.client.on_queue_full()
+                        self.client.logger.debug("Received message (hex): %s", message.hex())
+            quotes = self.client.quotes
+            if 0 < self.client.max_queue_size <= len(quotes):
+                self.client.on_queue_full()
+            else:
+                quotes.append(message)
+                if not self.client.quotes_ready.is_set():
+                    self.client.quotes_ready.set()
         except Exception as e:
             hex_message = ""
             if isinstance(message, str):
@@ -391,90 +432,157 @@ class QuoteReceiver(threading.Thread):
 
 class QuoteHandler(threading.Thread):
     def __init__(self, client, bypass_parsing: bool):
-        threading.Thread.__init__(self, args=(), kwargs=None)
+        threading.Thread.__init__(self, name="IntrinioQuoteHandler", args=(), kwargs=None)
         self.daemon = True
         self.client = client
         self.bypass_parsing = bypass_parsing
-        self.subprovider_codes = {
-            0: NO_SUBPROVIDER,
-            1: CTA_A,
-            2: CTA_B,
-            3: UTP,
-            4: OTC,
-            5: NASDAQ_BASIC,
-            6: IEX,
-        }
+        self.trade_batch = []
+        self.quote_batch = []
+        self.handle_trades = False
+        self.handle_quotes = False
+        self.batch_trades = False
+        self.batch_quotes = False
+        self.unknown_message_types = set()
 
     def parse_quote(self, quote_bytes: bytes, start_index: int = 0) -> Quote:
-        buffer = memoryview(quote_bytes)
-        symbol_length = buffer[start_index + 2]
-        symbol = buffer[(start_index + 3):(start_index + 3 + symbol_length)].tobytes().decode("ascii")
-        quote_type = "ask" if buffer[start_index] == 1 else "bid"
-        price, size, timestamp = struct.unpack_from('<fLQ', buffer, start_index + 6 + symbol_length)
+        symbol_length = quote_bytes[start_index + 2]
+        fields_start = start_index + 3 + symbol_length
+        symbol_bytes = bytes(quote_bytes[(start_index + 3):fields_start])
+        symbol = ascii_cache.get(symbol_bytes) or decode_ascii_cached(symbol_bytes)
+        quote_type = "ask" if quote_bytes[start_index] == 1 else "bid"
+        subprovider_code, market_center_code, price, size, timestamp, condition_length = QUOTE_LAYOUT.unpack_from(quote_bytes, fields_start)
 
-        condition_length = buffer[start_index + 22 + symbol_length]
         condition = ""
         if condition_length > 0:
-            condition = buffer[(start_index + 23 + symbol_length):(start_index + 23 + symbol_length + condition_length)].tobytes().decode("ascii")
+            condition_start = fields_start + 20
+            condition_bytes = bytes(quote_bytes[condition_start:(condition_start + condition_length)])
+            condition = ascii_cache.get(condition_bytes) or decode_ascii_cached(condition_bytes)
 
-        subprovider = self.subprovider_codes.get(buffer[3 + symbol_length + start_index], IEX)  # default IEX for backward behavior consistency.
-        market_center = buffer[(start_index + 4 + symbol_length):(start_index + 6 + symbol_length)].tobytes().decode("utf-16")
+        subprovider = SUBPROVIDER_BY_CODE[subprovider_code]
+        market_center = chr(market_center_code)
 
         return Quote(symbol, quote_type, price, size, timestamp, subprovider, market_center, condition)
 
 
     def parse_trade(self, trade_bytes: bytes, start_index: int = 0) -> Trade:
-        buffer = memoryview(trade_bytes)
-        symbol_length = buffer[start_index + 2]
-        symbol = buffer[(start_index + 3):(start_index + 3 + symbol_length)].tobytes().decode("ascii")
-        price, size, timestamp, total_volume = struct.unpack_from('<fLQL', buffer, start_index + 6 + symbol_length)
+        symbol_length = trade_bytes[start_index + 2]
+        fields_start = start_index + 3 + symbol_length
+        symbol_bytes = bytes(trade_bytes[(start_index + 3):fields_start])
+        symbol = ascii_cache.get(symbol_bytes) or decode_ascii_cached(symbol_bytes)
+        subprovider_code, market_center_code, price, size, timestamp, total_volume, condition_length = TRADE_LAYOUT.unpack_from(trade_bytes, fields_start)
         
-        condition_length = buffer[start_index + 26 + symbol_length]
         condition = ""
         if condition_length > 0:
-            condition = buffer[(start_index + 27 + symbol_length):(start_index + 27 + symbol_length + condition_length)].tobytes().decode("ascii")
+            condition_start = fields_start + 24
+            condition_bytes = bytes(trade_bytes[condition_start:(condition_start + condition_length)])
+            condition = ascii_cache.get(condition_bytes) or decode_ascii_cached(condition_bytes)
         
-        subprovider = self.subprovider_codes.get(buffer[3 + symbol_length + start_index], IEX) # default IEX for backward behavior consistency.
-        market_center = buffer[(start_index + 4 + symbol_length):(start_index + 6 + symbol_length)].tobytes().decode("utf-16")
+        subprovider = SUBPROVIDER_BY_CODE[subprovider_code]
+        market_center = chr(market_center_code)
         
         return Trade(symbol, price, size, total_volume, timestamp, subprovider, market_center, condition)
 
 
-    def parse_message(self, message_bytes: bytes, start_index: int, backlog_len: int) -> int:
-        message_type = message_bytes[start_index]
-        message_length = message_bytes[start_index + 1]
-        new_start_index = start_index + message_length
-        item = None
-        if message_type == 0:  # this is a trade
-            if callable(self.client.on_trade):
-                try:
-                    if self.bypass_parsing:
-                        item = message_bytes[start_index:new_start_index - 1]
-                    else:
-                        item = self.parse_trade(message_bytes, start_index)
-                    self.client.on_trade(item, backlog_len)
-                except Exception as e:
-                    self.client.logger.error(repr(e))
-        else:  # message_type is ask or bid (quote)
-            if callable(self.client.on_quote):
-                try:
-                    if self.bypass_parsing:
-                        item = message_bytes[start_index:new_start_index - 1]
-                    else:
-                        item = self.parse_quote(message_bytes, start_index)
-                    self.client.on_quote(item, backlog_len)
-                except Exception as e:
-                    self.client.logger.error(repr(e))
-
-        return new_start_index
+    def refresh_dispatch(self):
+        # Callbacks can be swapped at any time, so they are re-read once per batch of frames rather than once per message.
+        client = self.client
+        self.batch_trades = callable(client.on_trades)
+        self.batch_quotes = callable(client.on_quotes)
+        self.handle_trades = self.batch_trades or callable(client.on_trade)
+        self.handle_quotes = not client.tradesonly and (self.batch_quotes or callable(client.on_quote))
+
+    def handle_trade(self, message_bytes: bytes, start_index: int, new_start_index: int, backlog_len: int):
+        try:
+            if self.bypass_parsing:
+                item = message_bytes[start_index:new_start_index]
+            else:
+                item = self.parse_trade(message_bytes, start_index)
+            if self.batch_trades:
+                self.trade_batch.append(item)
+            else:
+                self.client.on_trade(item, backlog_len)
+        except Exception as e:
+            self.client.logger.error(repr(e))
+
+    def handle_quote(self, message_bytes: bytes, start_index: int, new_start_index: int, backlog_len: int):
+        try:
+            if self.bypass_parsing:
+                item = message_bytes[start_index:new_start_index]
+            else:
+                item = self.parse_quote(message_bytes, start_index)
+            if self.batch_quotes:
+                self.quote_batch.append(item)
+            else:
+                self.client.on_quote(item, backlog_len)
+        except Exception as e:
+            self.client.logger.error(repr(e))
+
+    def flush_batches(self, backlog_len: int):
+        if self.trade_batch:
+            trades = self.trade_batch
+            self.trade_batch = []
+            try:
+                self.client.on_trades(trades, backlog_len)
+            except Exception as e:
+                self.client.logger.error(repr(e))
+
+        if self.quote_batch:
+            quotes = self.quote_batch
+            self.quote_batch = []
+            try:
+                self.client.on_quotes(quotes, backlog_len)
+            except Exception as e:
+                self.client.logger.error(repr(e))
+
+    def pin_to_cpu(self, cpu: int):
+        # On Linux, pid 0 means the calling thread, so only this handler is pinned.
+        try:
+            os.sched_setaffinity(0, {cpu})
+            self.client.logger.info(f"QuoteHandler pinned to CPU {cpu}")
+        except (AttributeError, OSError, TypeError, ValueError) as e:
+            self.client.logger.warning(f"Could not pin QuoteHandler to CPU {cpu}: {repr(e)}")
 
     def run(self):
+        if self.client.parser_cpu is not None:
+            self.pin_to_cpu(self.client.parser_cpu)
         self.client.logger.debug("QuoteHandler ready")
+        # Bind the per-message lookups to locals once, outside the loop.
+        quotes = self.client.quotes
+        quotes_ready = self.client.quotes_ready
+        popleft = quotes.popleft
+        handle_trade = self.handle_trade
+        handle_quote = self.handle_quote
+        flush_batches = self.flush_batches
+        unknown_message_types = self.unknown_message_types
         while True:
-            message = self.client.quotes.get()
-            backlog_len = self.client.quotes.qsize()
-            if message is not None and len(message) > 0 and len(message) >= message[0] * 24: #sanity check on length. Should be at least as long as the smallest message times the number of messages it says it has.
-                items_in_message = message[0]
-                start_index = 1
-                for i in range(0, items_in_message):
-                    start_index = self.parse_message(message, start_index, backlog_len)
\ No newline at end of file
+            pending = len(quotes)
+            if not pending:
+                quotes_ready.wait()
+                # Clear before re-checking the deque, so an append that races with this is never missed.
+                quotes_ready.clear()
+                continue
+            # This is the only consumer, so every frame counted here can be popped without re-checking.
+            backlog_len = pending - 1
+            self.refresh_dispatch()
+            handle_trades = self.handle_trades
+            handle_quotes = self.handle_quotes
+            for _ in range(min(pending, HANDLER_BATCH_SIZE)):
+                message = popleft()
+                if message is not None and len(message) > 0 and len(message) >= message[0] * 24: #sanity check on length. Should be at least as long as the smallest message times the number of messages it says it has.
+                    items_in_message = message[0]
+                    start_index = 1
+                    for i in range(0, items_in_message):
+                        message_type = message[start_index]
+                        new_start_index = start_index + message[start_index + 1]
+                        if message_type == 0:
+                            if handle_trades:
+                                handle_trade(message, start_index, new_start_index, backlog_len)
+                        elif message_type == 1 or message_type == 2:  # ask or bid
+                            if handle_quotes:
+                                handle_quote(message, start_index, new_start_index, backlog_len)
+                        elif message_type not in unknown_message_types:
+                            # Records of an unknown type are skipped by their length; warn once per type, not once per record.
+                            unknown_message_types.add(message_type)
+                            self.client.logger.warning("Unknown message type: %s; skipping records of this type", message_type)
+                        start_index = new_start_index
+            flush_batches(backlog_len)
\ No newline at end of file
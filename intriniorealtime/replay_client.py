@@ -5,14 +5,22 @@ import threading
 import logging
 import queue
 import struct
-import sys
+import collections
+import concurrent.futures
+import heapq
+import itertools
 import intrinio_sdk as intrinio
 import tempfile
 import os
-import urllib.request
+import shutil
+import sys
 from typing import Optional, Dict, Any
 
-DEBUGGING = not (sys.gettrace() is None)
+# Fixed-width fields that follow the symbol: subprovider, market center, price, size, timestamp, [total volume,] condition length.
+# The market center is a single little-endian UTF-16 code unit.
+QUOTE_LAYOUT = struct.Struct('<BHfLQB')
+TRADE_LAYOUT = struct.Struct('<BHfLQLB')
+TIME_RECEIVED_LAYOUT = struct.Struct('<Q')
 
 
 class IntrinioRealtimeConstants:
@@ -31,10 +39,40 @@ class IntrinioRealtimeConstants:
     IEX = "IEX"
     SUB_PROVIDERS = [NO_SUBPROVIDER, CTA_A, CTA_B, UTP, OTC, NASDAQ_BASIC, IEX]
     MAX_QUEUE_SIZE = 1000000
-    EVENT_BUFFER_SIZE = 100
+    EVENT_BUFFER_SIZE = 256  # message count byte plus the largest message a one byte length allows
+    EVENT_BATCH_SIZE = 64
+    EVENT_PUSH_SIZE = 1024
+    FILE_READ_BUFFER_SIZE = 1024 * 1024
+    DOWNLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+    ASCII_CACHE_LIMIT = 16384
+
+
+# Indexed by the subprovider byte; unknown codes default to IEX for backward behavior consistency.
+SUBPROVIDER_BY_CODE = tuple(IntrinioRealtimeConstants.SUB_PROVIDERS + [IntrinioRealtimeConstants.IEX] * (256 - len(IntrinioRealtimeConstants.SUB_PROVIDERS)))
+SUBPROVIDER_API_VALUES = {
+    IntrinioRealtimeConstants.IEX: "iex",
+    IntrinioRealtimeConstants.UTP: "utp_delayed",
+    IntrinioRealtimeConstants.CTA_A: "cta_a_delayed",
+    IntrinioRealtimeConstants.CTA_B: "cta_b_delayed",
+    IntrinioRealtimeConstants.OTC: "otc_delayed",
+    IntrinioRealtimeConstants.NASDAQ_BASIC: "nasdaq_basic",
+}
+
+
+# Decoded symbols and conditions, shared by every worker thread; a lost race only decodes the same string twice.
+ascii_cache = {}
+
+
+def decode_ascii_cached(raw: bytes) -> str:
+    value = sys.intern(raw.decode("ascii"))
+    if len(ascii_cache) < IntrinioRealtimeConstants.ASCII_CACHE_LIMIT:
+        ascii_cache[raw] = value
+    return value
 
 
 class Quote:
+    __slots__ = ("symbol", "type", "price", "size", "timestamp", "subprovider", "market_center", "condition")
+
     def __init__(self, symbol, type, price, size, timestamp, subprovider, market_center, condition):
         self.symbol = symbol
         self.type = type
@@ -50,6 +88,8 @@ class Quote:
 
 
 class Trade:
+    __slots__ = ("symbol", "price", "size", "total_volume", "timestamp", "subprovider", "market_center", "condition")
+
     def __init__(self, symbol, price, size, total_volume, timestamp, subprovider, market_center, condition):
         self.symbol = symbol
         self.price = price
@@ -64,14 +104,82 @@ class Trade:
         return self.symbol + ", trade, price: " + str(self.price) + ", size: " + str(self.size) + ", timestamp: " + str(self.timestamp) + ", subprovider: " + str(self.subprovider) + ", market_center: " + str(self.market_center) + ", condition: " + str(self.condition)
 
 
+class EventQueue:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.items = collections.deque()
+        self.mutex = threading.Lock()
+        self.not_empty = threading.Condition(self.mutex)
+        self.not_full = threading.Condition(self.mutex)
+
+    def qsize(self):
+        return len(self.items)
+
+    def empty(self):
+        return not self.items
+
+    def full(self):
+        return 0 < self.maxsize <= len(self.items)
+
+    def put_nowait(self, item):
+        with self.mutex:
+            if 0 < self.maxsize <= len(self.items):
+                raise queue.Full
+            self.items.append(item)
+            if len(self.items) == 1:  # only a transition from empty can have workers waiting on it
+                self.not_empty.notify()
+
+    def put_many(self, new_items):
+        # Unlike put_nowait, this waits for room rather than dropping events.
+        index = 0
+        with self.mutex:
+            while index < len(new_items):
+                room = self.maxsize - len(self.items) if self.maxsize > 0 else len(new_items)
+                if room <= 0:
+                    self.not_full.wait()
+                    continue
+                was_empty = not self.items
+                self.items.extend(new_items[index:index + room])
+                index += room
+                if was_empty:
+                    self.not_empty.notify()
+
+    def get(self):
+        with self.not_empty:
+            while not self.items:
+                self.not_empty.wait()
+            was_full = 0 < self.maxsize <= len(self.items)
+            item = self.items.popleft()
+            if self.items:  # pass the wakeup on so idle workers pick up the rest
+                self.not_empty.notify()
+            if was_full:
+                self.not_full.notify()
+            return item
+
+    def get_batch(self, max_items):
+        with self.not_empty:
+            while not self.items:
+                self.not_empty.wait()
+            items = self.items
+            was_full = 0 < self.maxsize <= len(items)
+            batch = [items.popleft() for _ in range(min(len(items), max_items))]
+            if items:
+                self.not_empty.notify()
+            if was_full:
+                self.not_full.notify()
+            return batch
+
+
 class Tick:
+    __slots__ = ("time_received", "data")
+
     def __init__(self, time_received, data):
         self.time_received = time_received
         self.data = data
 
 
 class IntrinioReplayClient:
-    def __init__(self, options: Dict[str, Any], on_trade: callable, on_quote: callable):
+    def __init__(self, options: Dict[str, Any], on_trade: Optional[callable], on_quote: Optional[callable], on_trades: Optional[callable] = None, on_quotes: Optional[callable] = None):
         if options is None:
             raise ValueError("Options parameter is required")
 
@@ -85,6 +193,7 @@ class IntrinioReplayClient:
         self.worker_thread_count = options.get('worker_thread_count')
         self.write_to_csv = options.get('write_to_csv')
         self.csv_file_path = options.get('csv_file_path')
+        self.bypass_parsing = options.get('bypass_parsing', False)
 
         if (self.worker_thread_count is None) or (type(self.worker_thread_count) is not int) or self.worker_thread_count < 1:
             self.worker_thread_count = 4
@@ -108,9 +217,9 @@ class IntrinioReplayClient:
             self.logger.addHandler(log_handler)
 
         if 'max_queue_size' in options:
-            self.events = queue.Queue(maxsize=options['max_queue_size'])
+            self.events = EventQueue(options['max_queue_size'])
         else:
-            self.events = queue.Queue(maxsize=IntrinioRealtimeConstants.MAX_QUEUE_SIZE)
+            self.events = EventQueue(IntrinioRealtimeConstants.MAX_QUEUE_SIZE)
 
         if self.api_key:
             if not self.valid_api_key(self.api_key):
@@ -118,13 +227,16 @@ class IntrinioReplayClient:
         else:
             raise ValueError("API key is required")
 
-        if not callable(on_quote):
+        self.on_quotes = on_quotes if callable(on_quotes) else None
+        self.on_trades = on_trades if callable(on_trades) else None
+
+        if not callable(on_quote) and self.on_quotes is None:
             self.on_quote = None
             raise ValueError("Parameter 'on_quote' must be a function")
         else:
             self.on_quote = on_quote
 
-        if not callable(on_trade):
+        if not callable(on_trade) and self.on_trades is None:
             self.on_trade = None
             raise ValueError("Parameter 'on_trade' must be a function")
         else:
@@ -148,10 +260,18 @@ class IntrinioReplayClient:
         if self.write_to_csv and (('csv_file_path' not in options) or (type(self.csv_file_path) is not str)):
             raise ValueError(f"Parameter 'csv_file_path' is invalid, use a string path.")
 
+        if type(self.bypass_parsing) is not bool:
+            raise ValueError(f"Parameter 'bypass_parsing' is invalid, use a bool.")
+
+        if self.bypass_parsing and self.write_to_csv:
+            raise ValueError(f"Parameter 'write_to_csv' needs parsed events and cannot be combined with 'bypass_parsing'.")
+
         self.file_parsing_thread = None
         self.quote_handling_threads = []
         self.joined_channels = set()
+        self.joined_channels_snapshot = frozenset()
         self.last_queue_warning_time = 0
+        self.csv_file = None
 
     @staticmethod
     def valid_api_key(api_key):
@@ -167,62 +287,85 @@ class IntrinioReplayClient:
         try:
             self.logger.info("Connecting...")
             self.joined_channels = set()
+            self.publish_channels()
             self.refresh_channels()
             self.file_parsing_thread = FileParsingThread(self)
             self.file_parsing_thread.start()
-            self.quote_handling_threads = [None] * self.worker_thread_count
+            # A single worker gains nothing from a separate thread, so the file parsing thread handles events inline.
+            self.quote_handling_threads = [None] * (self.worker_thread_count if self.worker_thread_count > 1 else 0)
             for i in range(len(self.quote_handling_threads)):
                 self.quote_handling_threads[i] = QuoteHandlingThread(self)
                 self.quote_handling_threads[i].start()
         except Exception as e:
             self.logger.error(f"Cannot connect: {repr(e)}")
+            raise
 
     def disconnect(self):
         self.joined_channels = set()
+        self.publish_channels()
         if self.file_parsing_thread:
             self.file_parsing_thread.join()
         for thread in self.quote_handling_threads:
             thread.join()
         self.quote_handling_threads = []
+        if self.csv_file:
+            self.csv_file.close()
+            self.csv_file = None
+
+    def get_queue_size(self) -> int:
+        return self.events.qsize()
 
     def on_queue_full(self):
-        if time.time() - self.last_queue_warning_time > 1:
+        if time.monotonic() - self.last_queue_warning_time > 1:
             self.logger.error("Quote queue is full! Dropped some new events")
-            self.last_queue_warning_time = time.time()
+            self.last_queue_warning_time = time.monotonic()
 
     def join(self, channels):
         if isinstance(channels, str):
             channels = [channels]
 
-        self.channels = self.channels | set(channels)
-        self.refresh_channels()
+        new_channels = set(channels) - self.channels
+        self.channels |= new_channels
+        self.join_channels(new_channels - self.joined_channels)
 
     def leave(self, channels):
         if isinstance(channels, str):
             channels = [channels]
 
-        self.channels = self.channels - set(channels)
-        self.refresh_channels()
+        old_channels = self.channels.intersection(channels)
+        self.channels -= old_channels
+        self.leave_channels(old_channels & self.joined_channels)
 
     def leave_all(self):
         self.channels = set()
         self.refresh_channels()
 
     def refresh_channels(self):
-        # Join new channels
-        new_channels = self.channels - self.joined_channels
-        self.logger.debug(f"New channels: {new_channels}")
-        for channel in new_channels:
-            self.logger.info(f"Joined channel {channel}")
+        self.join_channels(self.channels - self.joined_channels)
+        self.leave_channels(self.joined_channels - self.channels)
+        self.logger.debug("Current channels: %s", self.joined_channels)
+
+    def join_channels(self, new_channels):
+        if not new_channels:
+            return
+
+        self.logger.debug("New channels: %s", new_channels)
+        self.joined_channels |= new_channels
+        self.publish_channels()
+        self.logger.info(f"Joined {len(new_channels)} channel(s)")
+
+    def leave_channels(self, old_channels):
+        if not old_channels:
+            return
 
-        # Leave old channels
-        old_channels = self.joined_channels - self.channels
-        self.logger.debug(f"Old channels: {old_channels}")
-        for channel in old_channels:
-            self.logger.info(f"Left channel {channel}")
+        self.logger.debug("Old channels: %s", old_channels)
+        self.joined_channels -= old_channels
+        self.publish_channels()
+        self.logger.info(f"Left {len(old_channels)} channel(s)")
 
-        self.joined_channels = self.channels.copy()
-        self.logger.debug(f"Current channels: {self.joined_channels}")
+    def publish_channels(self):
+        # Worker threads only ever read this immutable copy, never the set being mutated here.
+        self.joined_channels_snapshot = frozenset(self.joined_channels)
 
 
 class FileParsingThread(threading.Thread):
@@ -249,34 +392,31 @@ class FileParsingThread(threading.Thread):
             csv_writer = open(self.client.csv_file_path, "w")
             self.write_header_to_csv(csv_writer)
             csv_writer.close()
+            # Unbuffered append: each row is a single write call, so worker threads can share it without a lock.
+            self.client.csv_file = open(self.client.csv_file_path, "ab", buffering=0)
 
-        for tick in aggregated_ticks:
-            self.client.events.put_nowait(tick.data)
-
-        if self.client.delete_file_when_done:
-            for file_path in file_paths:
-                if os.path.exists(file_path):
-                    self.client.logger.info("Deleting file " + file_path)
-                    os.remove(file_path)
+        # Push in chunks to take the queue lock once per chunk; simulated delay pushes each tick as soon as it is due.
+        push_size = 1 if self.client.with_simulated_delay else IntrinioRealtimeConstants.EVENT_PUSH_SIZE
+        inline_handler = EventHandler(self.client) if self.client.worker_thread_count == 1 else None
+        try:
+            chunk = [tick.data for tick in itertools.islice(aggregated_ticks, push_size)]
+            while chunk:
+                if inline_handler:
+                    inline_handler.handle_messages(chunk, 0)
+                else:
+                    self.client.events.put_many(chunk)
+                chunk = [tick.data for tick in itertools.islice(aggregated_ticks, push_size)]
+        finally:
+            if self.client.delete_file_when_done:
+                for file_path in file_paths:
+                    if os.path.exists(file_path):
+                        self.client.logger.info("Deleting file " + file_path)
+                        os.remove(file_path)
         self.client.logger.debug("FileParsingThread exiting")
 
     @staticmethod
     def map_subprovider_to_api_value(sub_provider):
-        match sub_provider:
-            case IntrinioRealtimeConstants.IEX:
-                return "iex"
-            case IntrinioRealtimeConstants.UTP:
-                return "utp_delayed"
-            case IntrinioRealtimeConstants.CTA_A:
-                return "cta_a_delayed"
-            case IntrinioRealtimeConstants.CTA_B:
-                return "cta_b_delayed"
-            case IntrinioRealtimeConstants.OTC:
-                return "otc_delayed"
-            case IntrinioRealtimeConstants.NASDAQ_BASIC:
-                return "nasdaq_basic"
-            case _:
-                return "iex"
+        return SUBPROVIDER_API_VALUES.get(sub_provider, "iex")
 
     @staticmethod
     def map_provider_to_subproviders(provider):
@@ -299,119 +439,90 @@ class FileParsingThread(threading.Thread):
     def write_header_to_csv(csv_writer):
         csv_writer.write("\"Type\",\"Symbol\",\"Price\",\"Size\",\"Timestamp\",\"SubProvider\",\"MarketCenter\",\"Condition\",\"TotalVolume\"\r\n")
 
-    def get_file(self, subprovider):
-        intrinio.ApiClient().configuration.api_key['api_key'] = self.client.api_key
-        intrinio.ApiClient().allow_retries(True)
-        security_api = intrinio.SecurityApi()
+    def get_file_location(self, security_api, subprovider):
         api_response = security_api.get_security_replay_file(self.map_subprovider_to_api_value(subprovider), self.client.replay_date)
         decoded_url = api_response.url.replace("\u0026", "&")
         temp_dir = tempfile.gettempdir()
         file_path = os.path.join(temp_dir, api_response.name)
+        return decoded_url, file_path
+
+    def download_file(self, url, file_path):
         self.client.logger.info("Downloading file to " + file_path)
-        urllib.request.urlretrieve(decoded_url, file_path)
+        # requests does not promise Session is thread-safe, so each concurrent download gets its own.
+        with requests.Session() as session:
+            with session.get(url, stream=True) as response:
+                response.raise_for_status()
+                response.raw.decode_content = True  # undo any gzip transfer encoding while streaming
+                with open(file_path, "wb") as file:
+                    shutil.copyfileobj(response.raw, file, IntrinioRealtimeConstants.DOWNLOAD_CHUNK_SIZE)
         return file_path
 
     def get_all_files(self):
         subproviders = self.map_provider_to_subproviders(self.client.provider)
-        file_names = []
+        if not subproviders:
+            return []
+
+        # The shared SDK client is configured and queried on this thread only; just the downloads run in parallel.
+        intrinio.ApiClient().configuration.api_key['api_key'] = self.client.api_key
+        intrinio.ApiClient().allow_retries(True)
+        security_api = intrinio.SecurityApi()
+        locations = []
         for subprovider in subproviders:
             try:
-                file_names.append(self.get_file(subprovider))
+                locations.append((subprovider,) + self.get_file_location(security_api, subprovider))
             except Exception as e:
                 self.client.logger.info("Could not retrieve file for " + subprovider)
-        return file_names
+        if not locations:
+            return []
 
-    @staticmethod
-    def read_file_chunk(file_obj, chunk_size):
-        data = file_obj.read(chunk_size)
-        if not data:
-            return None
-        return data
+        # Each subprovider is a separate large download, so fetch them all at once.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(locations)) as executor:
+            futures = [executor.submit(self.download_file, url, file_path) for subprovider, url, file_path in locations]
 
-    @staticmethod
-    def copy_into(source, destination, destination_start_index):
-        for i in range(0, len(source)):
-            destination[destination_start_index + i] = source[i]
+        file_names = []
+        for (subprovider, url, file_path), future in zip(locations, futures):
+            try:
+                file_names.append(future.result())
+            except Exception as e:
+                self.client.logger.info("Could not retrieve file for " + subprovider)
+        return file_names
 
     def replay_tick_file_without_delay(self, file_path):
         if os.path.exists(file_path):
-            file = open(file_path, "rb")
-            read_result = self.read_file_chunk(file, 1)
-            while read_result is not None:
-                event_bytes = [0] * IntrinioRealtimeConstants.EVENT_BUFFER_SIZE
-                event_bytes[0] = 1  # This is the number of messages in the group
-                event_bytes[1] = int.from_bytes(read_result, "big")  # This is message type
-                event_bytes[2] = int.from_bytes(self.read_file_chunk(file, 1), "big")  # This is message length, including this and the previous byte.
-                self.copy_into(self.read_file_chunk(file, event_bytes[2] - 2), event_bytes, 3)  # read the rest of the message
-                time_received_bytes = self.read_file_chunk(file, 8)
-                time_received = struct.unpack_from('<Q', time_received_bytes, 0)[0]
-                yield Tick(time_received, bytearray(event_bytes))
-                read_result = self.read_file_chunk(file, 1)
-            file.close()
-        else:
-            yield None
+            # One buffer per file, reused for every record; each event is copied out once, at its exact length.
+            event_buffer = bytearray(IntrinioRealtimeConstants.EVENT_BUFFER_SIZE + 8)
+            event_view = memoryview(event_buffer)
+            event_buffer[0] = 1  # This is the number of messages in the group
+            with open(file_path, "rb", buffering=IntrinioRealtimeConstants.FILE_READ_BUFFER_SIZE) as file:
+                while file.readinto(event_view[1:3]) == 2:  # message type, then message length including both header bytes
+                    event_end = event_buffer[2] + 1
+                    if file.readinto(event_view[3:event_end + 8]) < event_end + 5:  # the rest of the message, followed by the 8 byte time received
+                        self.client.logger.warning(f"Truncated record at the end of {file_path}")
+                        break
+                    time_received = TIME_RECEIVED_LAYOUT.unpack_from(event_buffer, event_end)[0]
+                    yield Tick(time_received, bytes(event_view[:event_end]))
 
     def replay_file_group_with_delay(self, all_ticks):
-        multiplier = 1000000000
-        start = datetime.datetime.now(datetime.timezone.utc).timestamp() * multiplier
+        start = time.monotonic_ns()
         offset = 0
         for tick in self.replay_file_group_without_delay(all_ticks):
             if offset == 0:
                 offset = start - tick.time_received
 
             # sleep until the tick happens
-            if (tick.time_received + offset) <= datetime.datetime.now(datetime.timezone.utc).timestamp() * multiplier:
-                sleep_time = (datetime.datetime.now(datetime.timezone.utc).timestamp() * multiplier - (tick.time_received + offset)) / multiplier
-                time.sleep(sleep_time)
+            sleep_time = tick.time_received + offset - time.monotonic_ns()
+            if sleep_time > 0:
+                time.sleep(sleep_time / 1000000000)
             yield tick
 
     @staticmethod
-    def fill_next_ticks(enumerators, next_ticks):
-        for i in range(len(next_ticks)):
-            if next_ticks[i] is None:
-                try:
-                    next_ticks[i] = next(enumerators[i])
-                except StopIteration:
-                    pass
-
-    @staticmethod
-    def pull_next_tick(next_ticks):
-        pull_index = 0
-        t = 9223372036854775806  # max value
-        for i in range(len(next_ticks)):
-            if next_ticks[i] is not None and next_ticks[i].time_received < t:
-                pull_index = i
-                t = next_ticks[i].time_received
-
-        pulled_tick = next_ticks[pull_index]
-        next_ticks[pull_index] = None
-        return pulled_tick
-
-    @staticmethod
-    def has_any_value(next_ticks):
-        has_value = False
-        for i in range(len(next_ticks)):
-            if next_ticks[i] is not None:
-                has_value = True
-        return has_value
-
-    def replay_file_group_without_delay(self, tick_group):
-        next_ticks = [None] * len(tick_group)
-        enumerators = [None] * len(tick_group)
-        for i in range(len(tick_group)):
-            enumerators[i] = tick_group[i]
-
-        self.fill_next_ticks(enumerators, next_ticks)
-        while self.has_any_value(next_ticks):
-            next_tick = self.pull_next_tick(next_ticks)
-            if next_tick is not None:
-                yield next_tick
-            self.fill_next_ticks(enumerators, next_ticks)
+    def replay_file_group_without_delay(tick_group):
+        return heapq.merge(*tick_group, key=lambda tick: tick.time_received)
 
     def on_message(self, ws, message):
         try:
-            if DEBUGGING:  # This is here for performance reasons so we don't use slow reflection on every message.
-                self.client.logger.debug(f"Received message (hex): {message.hex()}")
+            if self.client.logger.isEnabledFor(logging.DEBUG):  # Only pay for the hex dump when it will be logged.
+                self.client.logger.debug("Received message (hex): %s", message.hex())
             self.client.events.put_nowait(message)
         except queue.Full:
             self.client.on_queue_full()
@@ -426,102 +537,180 @@ class FileParsingThread(threading.Thread):
             raise e
 
 
-class QuoteHandlingThread(threading.Thread):
+class EventHandler:
     def __init__(self, client):
-        threading.Thread.__init__(self, args=(), kwargs=None)
-        self.daemon = True
         self.client = client
-        self._csv_lock = threading.Lock()
-        self.subprovider_codes = {
-            0: IntrinioRealtimeConstants.NO_SUBPROVIDER,
-            1: IntrinioRealtimeConstants.CTA_A,
-            2: IntrinioRealtimeConstants.CTA_B,
-            3: IntrinioRealtimeConstants.UTP,
-            4: IntrinioRealtimeConstants.OTC,
-            5: IntrinioRealtimeConstants.NASDAQ_BASIC,
-            6: IntrinioRealtimeConstants.IEX,
-        }
-
-    def parse_quote(self, quote_bytes, start_index=0):
-        buffer = memoryview(quote_bytes)
-        symbol_length = buffer[start_index + 2]
-        symbol = buffer[(start_index + 3):(start_index + 3 + symbol_length)].tobytes().decode("ascii")
-        quote_type = "ask" if buffer[start_index] == 1 else "bid"
-        price, size, timestamp = struct.unpack_from('<fLQ', buffer, start_index + 6 + symbol_length)
-
-        condition_length = buffer[start_index + 22 + symbol_length]
+        self.trade_batch = []
+        self.quote_batch = []
+        self.handle_trades = False
+        self.handle_quotes = False
+        self.batch_trades = False
+        self.batch_quotes = False
+        self.subscribed_to_all = False
+        self.channels_snapshot = frozenset()
+        self.bypass_parsing = client.bypass_parsing
+        self.unknown_message_types = set()
+
+    @staticmethod
+    def parse_quote(quote_bytes, start_index=0):
+        symbol_length = quote_bytes[start_index + 2]
+        fields_start = start_index + 3 + symbol_length
+        symbol_bytes = bytes(quote_bytes[(start_index + 3):fields_start])
+        symbol = ascii_cache.get(symbol_bytes) or decode_ascii_cached(symbol_bytes)
+        quote_type = "ask" if quote_bytes[start_index] == 1 else "bid"
+        subprovider_code, market_center_code, price, size, timestamp, condition_length = QUOTE_LAYOUT.unpack_from(quote_bytes, fields_start)
+
         condition = ""
         if condition_length > 0:
-            condition = buffer[(start_index + 23 + symbol_length):(start_index + 23 + symbol_length + condition_length)].tobytes().decode("ascii")
+            condition_start = fields_start + 20
+            condition_bytes = bytes(quote_bytes[condition_start:(condition_start + condition_length)])
+            condition = ascii_cache.get(condition_bytes) or decode_ascii_cached(condition_bytes)
 
-        subprovider = self.subprovider_codes.get(buffer[3 + symbol_length + start_index], IntrinioRealtimeConstants.IEX)  # default IEX for backward behavior consistency.
-        market_center = buffer[(start_index + 4 + symbol_length):(start_index + 6 + symbol_length)].tobytes().decode("utf-16")
+        subprovider = SUBPROVIDER_BY_CODE[subprovider_code]
+        market_center = chr(market_center_code)
 
         return Quote(symbol, quote_type, price, size, timestamp, subprovider, market_center, condition)
 
-    def parse_trade(self, trade_bytes, start_index=0):
-        buffer = memoryview(trade_bytes)
-        symbol_length = buffer[start_index + 2]
-        symbol = buffer[(start_index + 3):(start_index + 3 + symbol_length)].tobytes().decode("ascii")
-        price, size, timestamp, total_volume = struct.unpack_from('<fLQL', buffer, start_index + 6 + symbol_length)
+    @staticmethod
+    def parse_trade(trade_bytes, start_index=0):
+        symbol_length = trade_bytes[start_index + 2]
+        fields_start = start_index + 3 + symbol_length
+        symbol_bytes = bytes(trade_bytes[(start_index + 3):fields_start])
+        symbol = ascii_cache.get(symbol_bytes) or decode_ascii_cached(symbol_bytes)
+        subprovider_code, market_center_code, price, size, timestamp, total_volume, condition_length = TRADE_LAYOUT.unpack_from(trade_bytes, fields_start)
 
-        condition_length = buffer[start_index + 26 + symbol_length]
         condition = ""
         if condition_length > 0:
-            condition = buffer[(start_index + 27 + symbol_length):(start_index + 27 + symbol_length + condition_length)].tobytes().decode("ascii")
+            condition_start = fields_start + 24
+            condition_bytes = bytes(trade_bytes[condition_start:(condition_start + condition_length)])
+            condition = ascii_cache.get(condition_bytes) or decode_ascii_cached(condition_bytes)
 
-        subprovider = self.subprovider_codes.get(buffer[3 + symbol_length + start_index], IntrinioRealtimeConstants.IEX)  # default IEX for backward behavior consistency.
-        market_center = buffer[(start_index + 4 + symbol_length):(start_index + 6 + symbol_length)].tobytes().decode("utf-16")
+        subprovider = SUBPROVIDER_BY_CODE[subprovider_code]
+        market_center = chr(market_center_code)
 
         return Trade(symbol, price, size, total_volume, timestamp, subprovider, market_center, condition)
 
-    def subscribed(self, ticker):
-        return 'lobby' in self.client.joined_channels or ticker in self.client.joined_channels
+    @staticmethod
+    def parse_symbol(message_bytes, start_index=0):
+        symbol_length = message_bytes[start_index + 2]
+        symbol_bytes = bytes(message_bytes[(start_index + 3):(start_index + 3 + symbol_length)])
+        return ascii_cache.get(symbol_bytes) or decode_ascii_cached(symbol_bytes)
+
+    def refresh_dispatch(self):
+        # Callbacks and channels can change at any time, so re-read them once per batch rather than once per message.
+        client = self.client
+        self.batch_trades = callable(client.on_trades)
+        self.batch_quotes = callable(client.on_quotes)
+        self.handle_trades = self.batch_trades or callable(client.on_trade)
+        self.handle_quotes = not client.tradesonly and (self.batch_quotes or callable(client.on_quote))
+        self.channels_snapshot = client.joined_channels_snapshot
+        self.subscribed_to_all = 'lobby' in self.channels_snapshot
 
     def write_quote_to_csv(self, quote):
         if self.client.write_to_csv:
-            with self._csv_lock:
-                csv_writer = open(self.client.csv_file_path, "a")
-                csv_writer.write(f"\"{quote.type}\",\"{quote.symbol}\",\"{quote.price}\",\"{quote.size}\",\"{quote.timestamp}\",\"{quote.subprovider}\",\"{quote.market_center}\",\"{quote.condition}\",\"\"\r\n")
-                csv_writer.close()
+            self.client.csv_file.write(f"\"{quote.type}\",\"{quote.symbol}\",\"{quote.price}\",\"{quote.size}\",\"{quote.timestamp}\",\"{quote.subprovider}\",\"{quote.market_center}\",\"{quote.condition}\",\"\"\r\n".encode())
 
     def write_trade_to_csv(self, trade):
         if self.client.write_to_csv:
-            with self._csv_lock:
-                csv_writer = open(self.client.csv_file_path, "a")
-                csv_writer.write(f"\"trade\",\"{trade.symbol}\",\"{trade.price}\",\"{trade.size}\",\"{trade.timestamp}\",\"{trade.subprovider}\",\"{trade.market_center}\",\"{trade.condition}\",\"{trade.total_volume}\"\r\n")
-                csv_writer.close()
-
-    def parse_message(self, bytes, start_index, backlog_len):
-        message_type = bytes[start_index]
-        message_length = bytes[start_index + 1]
-        new_start_index = start_index + message_length
-        item = None
-        if message_type == 0:  # this is a trade
-            item = self.parse_trade(bytes, start_index)
-            if callable(self.client.on_trade) and self.subscribed(item.symbol):
-                try:
-                    self.client.on_trade(item, backlog_len)
-                    self.write_trade_to_csv(item)
-                except Exception as e:
-                    self.client.logger.error(repr(e))
-        else:  # message_type is ask or bid (quote)
-            if not self.client.tradesonly:
-                item = self.parse_quote(bytes, start_index)
-                if callable(self.client.on_quote) and self.subscribed(item.symbol):
-                    try:
-                        self.client.on_quote(item, backlog_len)
-                        self.write_quote_to_csv(item)
-                    except Exception as e:
-                        self.client.logger.error(repr(e))
-        return new_start_index
+            self.client.csv_file.write(f"\"trade\",\"{trade.symbol}\",\"{trade.price}\",\"{trade.size}\",\"{trade.timestamp}\",\"{trade.subprovider}\",\"{trade.market_center}\",\"{trade.condition}\",\"{trade.total_volume}\"\r\n".encode())
 
-    def run(self):
-        self.client.logger.debug("QuoteHandlingThread ready")
-        while True:
-            message = self.client.events.get()
-            backlog_len = self.client.events.qsize()
+    def handle_trade(self, message_bytes, start_index, new_start_index, backlog_len):
+        try:
+            item = message_bytes[start_index:new_start_index] if self.bypass_parsing else self.parse_trade(message_bytes, start_index)
+            if self.batch_trades:
+                self.trade_batch.append(item)
+            else:
+                self.client.on_trade(item, backlog_len)
+                self.write_trade_to_csv(item)
+        except Exception as e:
+            self.client.logger.error(repr(e))
+
+    def handle_quote(self, message_bytes, start_index, new_start_index, backlog_len):
+        try:
+            item = message_bytes[start_index:new_start_index] if self.bypass_parsing else self.parse_quote(message_bytes, start_index)
+            if self.batch_quotes:
+                self.quote_batch.append(item)
+            else:
+                self.client.on_quote(item, backlog_len)
+                self.write_quote_to_csv(item)
+        except Exception as e:
+            self.client.logger.error(repr(e))
+
+    def flush_batches(self, backlog_len):
+        if self.trade_batch:
+            trades = self.trade_batch
+            self.trade_batch = []
+            try:
+                self.client.on_trades(trades, backlog_len)
+                for trade in trades:
+                    self.write_trade_to_csv(trade)
+            except Exception as e:
+                self.client.logger.error(repr(e))
+
+        if self.quote_batch:
+            quotes = self.quote_batch
+            self.quote_batch = []
+            try:
+                self.client.on_quotes(quotes, backlog_len)
+                for quote in quotes:
+                    self.write_quote_to_csv(quote)
+            except Exception as e:
+                self.client.logger.error(repr(e))
+
+    def handle_messages(self, messages, backlog_len):
+        self.refresh_dispatch()
+        # Bind everything the per-record loop reads to locals once per batch.
+        handle_trades = self.handle_trades
+        handle_quotes = self.handle_quotes
+        subscribed_to_all = self.subscribed_to_all
+        channels = self.channels_snapshot
+        parse_symbol = self.parse_symbol
+        handle_trade = self.handle_trade
+        handle_quote = self.handle_quote
+        unknown_message_types = self.unknown_message_types
+        for message in messages:
             items_in_message = message[0]
             start_index = 1
             for i in range(0, items_in_message):
-                start_index = self.parse_message(message, start_index, backlog_len)
+                message_type = message[start_index]
+                new_start_index = start_index + message[start_index + 1]
+                # Only the symbol is needed to filter, so skip decoding the rest of the message until it passes.
+                if message_type == 0:  # this is a trade
+                    if handle_trades and (subscribed_to_all or parse_symbol(message, start_index) in channels):
+                        handle_trade(message, start_index, new_start_index, backlog_len)
+                elif message_type == 1 or message_type == 2:  # ask or bid (quote)
+                    if handle_quotes and (subscribed_to_all or parse_symbol(message, start_index) in channels):
+                        handle_quote(message, start_index, new_start_index, backlog_len)
+                elif message_type not in unknown_message_types:
+                    # Records of an unknown type are skipped by their length; warn once per type, not once per record.
+                    unknown_message_types.add(message_type)
+                    self.client.logger.warning("Unknown message type: %s; skipping records of this type", message_type)
+                start_index = new_start_index
+        self.flush_batches(backlog_len)
+
+
+class QuoteHandlingThread(threading.Thread):
+    # The parsers live on EventHandler; these keep QuoteHandlingThread.parse_* working for existing callers.
+    parse_quote = staticmethod(EventHandler.parse_quote)
+    parse_trade = staticmethod(EventHandler.parse_trade)
+    parse_symbol = staticmethod(EventHandler.parse_symbol)
+
+    def __init__(self, client):
+        threading.Thread.__init__(self, args=(), kwargs=None)
+        self.daemon = True
+        self.client = client
+        self.handler = EventHandler(client)
+
+    def subscribed(self, ticker):
+        channels = self.client.joined_channels_snapshot
+        return 'lobby' in channels or ticker in channels
+
+    def run(self):
+        self.client.logger.debug("QuoteHandlingThread ready")
+        get_batch = self.client.events.get_batch
+        qsize = self.client.events.qsize
+        handle_messages = self.handler.handle_messages
+        batch_size = IntrinioRealtimeConstants.EVENT_BATCH_SIZE
+        while True:
+            messages = get_batch(batch_size)
+            handle_messages(messages, qsize())